@@ -0,0 +1,153 @@
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, Literal
+
+# Số pipeline /ask được chạy đồng thời tối đa
+MAX_INFLIGHT = int(os.getenv("ASK_MAX_INFLIGHT", "4"))
+# Số request được phép chờ trong hàng đợi
+MAX_QUEUE = int(os.getenv("ASK_MAX_QUEUE", "16"))
+# Thời gian chờ tối đa (giây) trong hàng đợi trước khi trả về 503
+QUEUE_TIMEOUT = float(os.getenv("ASK_QUEUE_TIMEOUT", "10"))
+
+# Các lớp ưu tiên, số nhỏ hơn được phục vụ trước
+PRIORITY_CLASSES = {
+    "interactive": 0,
+    "batch": 1,
+}
+DEFAULT_PRIORITY = "interactive"
+Priority = Literal["interactive", "batch"]
+# Tỉ lệ hàng đợi mà traffic batch được phép chiếm, phần còn lại dành cho interactive
+BATCH_QUEUE_SHARE = 0.5
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted to the pipeline."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Giới hạn số pipeline chạy đồng thời với hàng đợi có giới hạn và deadline.
+
+    Request vượt quá số slot sẽ chờ trong hàng đợi theo lớp ưu tiên. Khi hàng đợi
+    đầy, request bị từ chối ngay với 429; khi chờ quá deadline thì trả về 503.
+    """
+
+    def __init__(self, max_inflight: int = MAX_INFLIGHT, max_queue: int = MAX_QUEUE,
+                 queue_timeout: float = QUEUE_TIMEOUT):
+        self.max_inflight = max(1, max_inflight)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._inflight = 0
+        self._waiters = {name: deque() for name in PRIORITY_CLASSES}
+        # Thời gian xử lý trung bình (EWMA) để ước lượng Retry-After
+        self._avg_service_time = 1.0
+        self._counters = {
+            "admitted": 0,
+            "completed": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+        }
+
+    def _queued(self, priority: Optional[str] = None) -> int:
+        if priority is not None:
+            return len(self._waiters[priority])
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def _queue_limit(self, priority: str) -> int:
+        if priority == "batch":
+            return int(self.max_queue * BATCH_QUEUE_SHARE)
+        return self.max_queue
+
+    def _retry_after(self) -> int:
+        """Estimate how long until a slot frees up, in whole seconds."""
+        waves = (self._queued() + 1) / self.max_inflight
+        return max(1, math.ceil(self._avg_service_time * waves))
+
+    async def acquire(self, priority: Priority = DEFAULT_PRIORITY) -> None:
+        """Wait for a pipeline slot, or raise AdmissionRejected."""
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class: {priority}")
+
+        # Còn slot trống và không ai đang chờ: vào luôn
+        if self._inflight < self.max_inflight and self._queued() == 0:
+            self._inflight += 1
+            self._counters["admitted"] += 1
+            return
+
+        # Hàng đợi đầy: từ chối nhanh
+        queue_full = self._queued() >= self.max_queue or self._queued(priority) >= self._queue_limit(priority)
+        if queue_full:
+            self._counters["rejected_queue_full"] += 1
+            raise AdmissionRejected(429, "Server is busy, queue is full", self._retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # Slot được trao đúng lúc hết hạn, vẫn nhận slot đó
+                self._counters["admitted"] += 1
+                return
+            waiter.cancel()
+            self._waiters[priority].remove(waiter)
+            self._counters["rejected_timeout"] += 1
+            raise AdmissionRejected(503, "Timed out waiting for a free slot", self._retry_after())
+        except asyncio.CancelledError:
+            # Client ngắt kết nối khi đang chờ
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                waiter.cancel()
+                self._waiters[priority].remove(waiter)
+            raise
+        self._counters["admitted"] += 1
+
+    def release(self, service_time: Optional[float] = None) -> None:
+        """Free a slot, handing it directly to the highest-priority waiter."""
+        if service_time is not None:
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * service_time
+            self._counters["completed"] += 1
+
+        for priority in sorted(PRIORITY_CLASSES, key=PRIORITY_CLASSES.get):
+            waiters = self._waiters[priority]
+            while waiters:
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    # Giữ nguyên số inflight, slot chuyển thẳng cho request đang chờ
+                    waiter.set_result(None)
+                    return
+        self._inflight -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = DEFAULT_PRIORITY):
+        """Async context manager holding a pipeline slot for the duration of the block."""
+        await self.acquire(priority)
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start_time)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return current queue depth, in-flight count and rejection counters."""
+        return {
+            "inflight": self._inflight,
+            "max_inflight": self.max_inflight,
+            "queued": self._queued(),
+            "queued_by_priority": {name: self._queued(name) for name in PRIORITY_CLASSES},
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "avg_service_time": round(self._avg_service_time, 3),
+            **self._counters,
+        }
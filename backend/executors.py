@@ -0,0 +1,107 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable
+
+# Số thread cho từng loại công việc blocking
+# Encode mặc định 1 thread: torch đã tự dùng nhiều thread intra-op cho mỗi lần encode,
+# nên 2 encode song song chỉ tranh nhau CPU; mỗi thread encode còn phải giữ model riêng
+# (tokenizer của Hugging Face không thread-safe), tốn thêm bộ nhớ cho mỗi thread.
+ENCODE_WORKERS = int(os.getenv("ENCODE_WORKERS", "1"))
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "2"))
+IO_WORKERS = int(os.getenv("IO_WORKERS", "8"))
+
+
+class MeteredExecutor:
+    """
+    ThreadPoolExecutor có kích thước cố định, ghi lại thời gian chờ trong hàng đợi
+    (từ lúc submit đến lúc thread bắt đầu chạy) và thời gian chạy của mỗi task.
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{name}-worker")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._queue_time_total = 0.0
+        self._queue_time_max = 0.0
+        self._run_time_total = 0.0
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a blocking callable on this executor without blocking the event loop."""
+        submitted_at = time.monotonic()
+        dequeued = threading.Event()
+        with self._lock:
+            self._pending += 1
+
+        def leave_queue() -> None:
+            # Gọi dưới lock; chỉ giảm pending một lần dù task chạy hay bị hủy
+            if not dequeued.is_set():
+                dequeued.set()
+                self._pending -= 1
+
+        def task():
+            started_at = time.monotonic()
+            queue_time = started_at - submitted_at
+            with self._lock:
+                leave_queue()
+                self._running += 1
+                self._queue_time_total += queue_time
+                self._queue_time_max = max(self._queue_time_max, queue_time)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._run_time_total += time.monotonic() - started_at
+
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, task)
+        except asyncio.CancelledError:
+            # Task bị hủy trước khi chạy thì không còn nằm trong hàng đợi
+            with self._lock:
+                leave_queue()
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth and queue/run time metrics for this executor."""
+        with self._lock:
+            completed = self._completed
+            return {
+                "max_workers": self.max_workers,
+                "pending": self._pending,
+                "running": self._running,
+                "completed": completed,
+                "avg_queue_time": round(self._queue_time_total / completed, 4) if completed else 0.0,
+                "max_queue_time": round(self._queue_time_max, 4),
+                "avg_run_time": round(self._run_time_total / completed, 4) if completed else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+# Executor riêng cho từng loại công việc để một hệ thống chậm không làm nghẽn các hệ thống khác
+encode_executor = MeteredExecutor("encode", ENCODE_WORKERS)  # SentenceTransformer encode (CPU)
+search_executor = MeteredExecutor("search", SEARCH_WORKERS)  # FAISS index search
+io_executor = MeteredExecutor("io", IO_WORKERS)  # DuckDuckGo, Gemini (network)
+
+
+def executor_stats() -> Dict[str, Dict[str, Any]]:
+    """Return metrics for all dedicated executors."""
+    return {
+        executor.name: executor.stats()
+        for executor in (encode_executor, search_executor, io_executor)
+    }
+
+
+def shutdown_executors() -> None:
+    for executor in (encode_executor, search_executor, io_executor):
+        executor.shutdown()
@@ -3,6 +3,7 @@ import json
 import google.generativeai as genai
 from typing import Dict, Any, Optional
 from dotenv import load_dotenv
+from executors import io_executor
 
 # Helper function to load Gemini API key
 def load_gemini_api_key():
@@ -52,9 +53,8 @@ class GeminiClient:
             # Generate the prompt for Gemini
             prompt = self._create_mcq_prompt(question, context)
             
-            # Call Gemini API
-            model = genai.GenerativeModel(self.model_name)
-            response = model.generate_content(prompt)
+            # Call Gemini API on the I/O executor so the event loop is not blocked
+            response = await io_executor.run(self._generate_content, prompt)
             
             # Parse the response
             result = self._parse_gemini_response(response.text)
@@ -68,6 +68,12 @@ class GeminiClient:
                 "reasoning": f"Failed to get answer from Gemini API: {str(e)}"
             }
     
+    def _generate_content(self, prompt: str):
+        """Blocking Gemini call; runs on an I/O worker thread."""
+        # Model objects are created per call so no client state is shared across threads
+        model = genai.GenerativeModel(self.model_name)
+        return model.generate_content(prompt)
+    
     def _create_mcq_prompt(self, question: str, context: str) -> str:
         """Create a prompt for the Gemini API to answer a multiple-choice question."""
         return f"""You are an AI assistant that answers multiple-choice questions based ONLY on the provided context.
@@ -1,11 +1,13 @@
 import os
 import json
+import time
 from fastapi import FastAPI, Request, HTTPException, Depends, Form
 from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import Optional
 import uvicorn
 from pathlib import Path
 from dotenv import load_dotenv
@@ -13,6 +15,9 @@ from dotenv import load_dotenv
 # Import our RAG components
 from vector_db import VectorDB, initialize_vector_db
 from rag_pipeline import RAGPipeline
+from admission import AdmissionController, AdmissionRejected, DEFAULT_PRIORITY, Priority
+from executors import executor_stats, shutdown_executors
+from traffic_capture import TrafficRecorder
 
 # Load environment variables
 load_dotenv()
@@ -36,6 +41,10 @@ ENV_PATH = "../.env"
 # Initialize the vector DB and RAG pipeline
 vector_db = None
 rag_pipeline = None
+# Giới hạn số request /ask chạy đồng thời và hàng đợi chờ
+admission_controller = AdmissionController()
+# Ghi lại mẫu traffic /ask để replay offline (bật bằng CAPTURE_ENABLED=true)
+traffic_recorder = TrafficRecorder()
 gemini_api_key = os.getenv("GEMINI_API_KEY", "")
 
 # Helper function to check if API key is set
@@ -80,7 +89,7 @@ async def startup_event():
         
         # Initialize RAG pipeline
         print("Initializing RAG pipeline...")
-        rag_pipeline = RAGPipeline(vector_db)
+        rag_pipeline = RAGPipeline(vector_db, recorder=traffic_recorder)
         
         print("Startup completed successfully!")
     
@@ -88,10 +97,19 @@ async def startup_event():
         print(f"Error during startup: {str(e)}")
         # Again, we continue to avoid crashing, but functionality will be limited
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the dedicated worker pools."""
+    shutdown_executors()
+    traffic_recorder.close()
+
 # Define request models
 class QuestionRequest(BaseModel):
     question: str
     use_web_search: bool = True  # Cho phép tùy chọn bật/tắt tìm kiếm web
+    priority: Priority = DEFAULT_PRIORITY  # "interactive" hoặc "batch"
+    option_aware: bool = False  # Truy xuất bằng chứng riêng cho từng đáp án A-D
+    evidence_budget: Optional[int] = Field(default=None, ge=1, le=10)  # Tổng số chunk cho các đáp án, mặc định mỗi đáp án một chunk
 
 class ApiKeyRequest(BaseModel):
     api_key: str
@@ -116,6 +134,9 @@ async def root():
                 <li><code>POST /ask</code> - Send a question to get an answer</li>
                 <li><code>POST /set-api-key</code> - Set your Gemini API key</li>
                 <li><code>GET /api-key-status</code> - Check if API key is set</li>
+                <li><code>GET /admission-stats</code> - Queue depth and rejection counts for /ask</li>
+                <li><code>GET /executor-stats</code> - Queue-time metrics for the worker pools</li>
+                <li><code>GET /capture-stats</code> - Traffic capture record counts</li>
             </ul>
             <p>Example POST body:</p>
             <pre><code>
@@ -132,6 +153,21 @@ async def get_api_key_status():
     """Check if an API key is set."""
     return {"is_set": is_api_key_set()}
 
+@app.get("/admission-stats")
+async def get_admission_stats():
+    """Return in-flight, queue depth and rejection counters for /ask."""
+    return admission_controller.stats()
+
+@app.get("/executor-stats")
+async def get_executor_stats():
+    """Return queue depth and queue-time metrics for the encode, search and I/O executors."""
+    return executor_stats()
+
+@app.get("/capture-stats")
+async def get_capture_stats():
+    """Return traffic capture settings and written / dropped record counts."""
+    return traffic_recorder.stats()
+
 @app.post("/set-api-key")
 async def set_api_key(request: ApiKeyRequest):
     """Set the Gemini API key."""
@@ -144,7 +180,7 @@ async def set_api_key(request: ApiKeyRequest):
         
         # Re-initialize RAG pipeline to use the new API key
         global rag_pipeline
-        rag_pipeline = RAGPipeline(vector_db)
+        rag_pipeline = RAGPipeline(vector_db, recorder=traffic_recorder)
         
         return {"status": "success", "message": "API key set successfully"}
     
@@ -156,6 +192,8 @@ async def set_api_key(request: ApiKeyRequest):
 async def ask_question(request: QuestionRequest):
     """Process a question and return an answer using the RAG pipeline."""
     global rag_pipeline
+    # Thời điểm request đến, trước khi chờ slot, để capture ghi đúng nhịp đến của traffic
+    arrival_time = time.time()
     
     # Check if API key is set
     if not is_api_key_set():
@@ -169,13 +207,26 @@ async def ask_question(request: QuestionRequest):
         raise HTTPException(status_code=500, detail="RAG pipeline not initialized")
     
     try:
-        # Process the question through the RAG pipeline with web search option
-        result = await rag_pipeline.answer_question(
-            question=request.question,
-            use_web_search=request.use_web_search
-        )
+        # Wait for a pipeline slot; rejected quickly when the queue is full
+        async with admission_controller.slot(request.priority):
+            # Process the question through the RAG pipeline with web search option
+            result = await rag_pipeline.answer_question(
+                question=request.question,
+                use_web_search=request.use_web_search,
+                option_aware=request.option_aware,
+                evidence_budget=request.evidence_budget,
+                arrival_time=arrival_time
+            )
         return result
     
+    except AdmissionRejected as e:
+        print(f"Rejected question ({e.status_code}): {e.reason}")
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.reason,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
     except Exception as e:
         print(f"Error processing question: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,15 +1,23 @@
-from typing import Dict, Any, List
+import time
+import uuid
+from typing import Dict, Any, List, Optional
 from vector_db import VectorDB
 from retrieval import Retriever
 from gemini_api import GeminiClient
+from traffic_capture import TrafficRecorder, build_capture_record
 
 class RAGPipeline:
-    def __init__(self, vector_db: VectorDB):
+    def __init__(self, vector_db: VectorDB, recorder: Optional[TrafficRecorder] = None):
         self.vector_db = vector_db
         self.retriever = Retriever(vector_db)
         self.llm_client = GeminiClient()
+        # Optional sampled traffic capture for offline replay
+        self.recorder = recorder
         
-    async def answer_question(self, question: str, top_k: int = 3, use_web_search: bool = True) -> Dict[str, Any]:
+    async def answer_question(self, question: str, top_k: int = 3, use_web_search: bool = True,
+                              option_aware: bool = False, evidence_budget: Optional[int] = None,
+                              request_id: Optional[str] = None,
+                              arrival_time: Optional[float] = None) -> Dict[str, Any]:
         """
         Process a question through the RAG pipeline.
         
@@ -17,19 +25,44 @@ class RAGPipeline:
             question: The multiple-choice question to answer
             top_k: Number of relevant document chunks to retrieve
             use_web_search: Whether to include web search results
+            option_aware: Retrieve evidence per answer option with batched sub-queries
+            evidence_budget: Local chunks shared by all options in option-aware mode
+                (default max(top_k, number of options))
+            request_id: Identifier stored with the capture record (generated if not given)
+            arrival_time: Wall-clock time the request arrived, before admission (defaults to now)
             
         Returns:
             Dictionary with answer, reasoning, and relevant contexts
         """
         try:
+            start_time = time.perf_counter()
+            # Thời điểm request đến, dùng làm mốc thời gian khi replay
+            if arrival_time is None:
+                arrival_time = time.time()
+            admission_wait = max(0.0, time.time() - arrival_time)
+            
             # Step 1: Retrieve relevant document chunks and optionally web results
-            retrieved_results = await self.retriever.retrieve(question, top_k=top_k, use_web_search=use_web_search)
+            retrieved_results = await self.retriever.retrieve(
+                question, top_k=top_k, use_web_search=use_web_search,
+                option_aware=option_aware, evidence_budget=evidence_budget
+            )
+            timings = dict(retrieved_results.get("timings", {}))
+            timings["admission_wait"] = admission_wait
+            timings["retrieve"] = time.perf_counter() - start_time
+            flags = {
+                "top_k": top_k,
+                "use_web_search": use_web_search,
+                "option_aware": option_aware,
+                "evidence_budget": evidence_budget
+            }
             
             # Step 2: Prepare context for the LLM
             context = self.retriever.get_context_from_results(retrieved_results)
             
             # If no relevant documents found, return early
             if not context or context == "Không tìm thấy thông tin liên quan.":
+                timings["total"] = time.perf_counter() - start_time
+                self._capture(request_id, arrival_time, question, flags, retrieved_results, None, timings)
                 return {
                     "answer": "Không đủ thông tin",
                     "reasoning": "No relevant information found in the knowledge base or web search.",
@@ -37,7 +70,9 @@ class RAGPipeline:
                 }
             
             # Step 3: Generate answer using the LLM
+            llm_start_time = time.perf_counter()
             response = await self.llm_client.answer_mcq(question, context)
+            timings["llm"] = time.perf_counter() - llm_start_time
             
             # Step 4: Prepare the final result
             # Chuẩn bị contexts để trả về cho frontend
@@ -57,6 +92,9 @@ class RAGPipeline:
                 "has_web_results": len(web_contexts) > 0
             }
             
+            timings["total"] = time.perf_counter() - start_time
+            self._capture(request_id, arrival_time, question, flags, retrieved_results, response, timings)
+            
             return result
             
         except Exception as e:
@@ -66,4 +104,19 @@ class RAGPipeline:
                 "reasoning": f"An error occurred: {str(e)}",
                 "contexts": {"local": [], "web": []},
                 "has_web_results": False
-            } 
\ No newline at end of file
+            } 
+    
+    def _capture(self, request_id: Optional[str], arrival_time: float, question: str,
+                 flags: Dict[str, Any], retrieved_results: Dict[str, Any], llm_response: Optional[Dict[str, Any]],
+                 timings: Dict[str, float]) -> None:
+        """Queue a capture record for this request if it is sampled. Never blocks or raises."""
+        if self.recorder is None or not self.recorder.should_sample():
+            return
+        try:
+            record = build_capture_record(
+                request_id or uuid.uuid4().hex, arrival_time, question, flags,
+                retrieved_results, llm_response, timings
+            )
+            self.recorder.submit(record)
+        except Exception as e:
+            print(f"Error capturing request: {str(e)}")
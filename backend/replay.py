@@ -0,0 +1,217 @@
+"""
+Replay captured /ask traffic through the RAG pipeline for offline profiling.
+
+Local retrieval (encoding + FAISS) runs for real against the current index, while
+web search and Gemini responses are served from the capture, so cache, index and
+batching changes can be measured without network calls.
+
+Usage:
+    python replay.py ../captures/capture-*.jsonl.gz --speed 2
+    python replay.py capture.jsonl.gz --cprofile replay.prof
+    python replay.py capture.jsonl.gz --wait-for-profiler 10   # attach py-spy to the printed PID
+
+cProfile only sees the event loop thread; use py-spy to profile the encode/search/io worker pools.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import cProfile
+import contextvars
+from typing import Dict, Any, List
+
+from vector_db import initialize_vector_db
+from rag_pipeline import RAGPipeline
+from web_search import WebSearcher
+from traffic_capture import TrafficRecorder, load_capture
+
+# Path to the document file
+DOCUMENT_PATH = "../data/knowledge.txt"
+
+# Vị trí trong capture của request đang replay trong task hiện tại; các stub dùng nó
+# để lấy đúng bản ghi, kể cả khi cùng một câu hỏi xuất hiện nhiều lần
+current_record_index: contextvars.ContextVar[int] = contextvars.ContextVar("current_record_index")
+
+
+class ReplayWebSearcher(WebSearcher):
+    """Serves web results recorded in the capture instead of calling DuckDuckGo."""
+
+    def __init__(self, records: List[Dict[str, Any]], simulate_latency: bool = False):
+        super().__init__()
+        self.records = records
+        self.simulate_latency = simulate_latency
+
+    async def search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+        record = self.records[current_record_index.get()]
+        if self.simulate_latency:
+            await asyncio.sleep(record.get("timings", {}).get("web_search", 0.0))
+        return record.get("web_results", [])[:max_results]
+
+
+class ReplayLLMClient:
+    """Serves Gemini answers recorded in the capture instead of calling the API."""
+
+    def __init__(self, records: List[Dict[str, Any]], simulate_latency: bool = False):
+        self.records = records
+        self.simulate_latency = simulate_latency
+
+    async def answer_mcq(self, question: str, context: str) -> Dict[str, Any]:
+        record = self.records[current_record_index.get()]
+        if self.simulate_latency:
+            await asyncio.sleep(record.get("timings", {}).get("llm", 0.0))
+        return record.get("llm_response") or {
+            "answer": "Không đủ thông tin",
+            "reasoning": "No recorded LLM response for this question."
+        }
+
+
+class ReplayRecorder(TrafficRecorder):
+    """Keeps every replayed request's capture record in memory, keyed by request id."""
+
+    def __init__(self):
+        super().__init__(enabled=True, sample_rate=1.0)
+        self.records: Dict[str, Dict[str, Any]] = {}
+
+    def submit(self, record: Dict[str, Any]) -> None:
+        # Lưu ngay trong bộ nhớ, không qua thread ghi, để pop() thấy được bản ghi
+        with self._lock:
+            self.records[record["request_id"]] = record
+
+    def pop(self, request_id: str) -> Dict[str, Any]:
+        with self._lock:
+            return self.records.pop(request_id, {})
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def build_pipeline(records: List[Dict[str, Any]], simulate_latency: bool) -> RAGPipeline:
+    """Build a pipeline over the real vector DB with recorded web and LLM responses."""
+    pipeline = RAGPipeline(initialize_vector_db(DOCUMENT_PATH), recorder=ReplayRecorder())
+    pipeline.retriever.web_searcher = ReplayWebSearcher(records, simulate_latency)
+    pipeline.llm_client = ReplayLLMClient(records, simulate_latency)
+    return pipeline
+
+
+async def replay(pipeline: RAGPipeline, records: List[Dict[str, Any]], speed: float,
+                 option_aware: bool = False) -> List[Dict[str, Any]]:
+    """
+    Send every record through the pipeline, preserving the original arrival
+    pattern scaled by `speed` (0 sends everything at once). `option_aware`
+    forces option-aware retrieval for every request.
+    """
+    outcomes = []
+
+    async def run_one(index: int, record: Dict[str, Any], delay: float) -> None:
+        await asyncio.sleep(delay)
+        # Mỗi coroutine chạy trong task riêng của gather nên giá trị này không lẫn giữa các request
+        current_record_index.set(index)
+        request_id = f"replay-{index}"
+        start_time = time.perf_counter()
+        result = await pipeline.answer_question(
+            question=record["question"],
+            top_k=record.get("top_k", 3),
+            use_web_search=record.get("use_web_search", True),
+            option_aware=option_aware or record.get("option_aware", False),
+            evidence_budget=record.get("evidence_budget"),
+            request_id=request_id
+        )
+        latency = time.perf_counter() - start_time
+        # Bản ghi mới của pipeline chứa chunk id và thời gian từng bước của lần replay này
+        replayed = pipeline.recorder.pop(request_id)
+        outcomes.append({
+            "record": record,
+            "result": result,
+            "latency": latency,
+            "timings": replayed.get("timings", {}),
+            "chunk_ids": [res["chunk_id"] for res in replayed.get("local_results", [])]
+        })
+
+    first_timestamp = min(record.get("timestamp", 0.0) for record in records)
+    tasks = []
+    for index, record in enumerate(records):
+        offset = max(0.0, record.get("timestamp", first_timestamp) - first_timestamp)
+        delay = offset / speed if speed > 0 else 0.0
+        tasks.append(run_one(index, record, delay))
+    await asyncio.gather(*tasks)
+    return outcomes
+
+
+def report(outcomes: List[Dict[str, Any]], wall_time: float) -> None:
+    """Print latency percentiles and how many answers / retrievals differ from the capture."""
+    latencies = [outcome["latency"] for outcome in outcomes]
+    local_search = [outcome["timings"].get("local_search", 0.0) for outcome in outcomes]
+    recorded_local = [outcome["record"].get("timings", {}).get("local_search", 0.0) for outcome in outcomes]
+
+    changed_chunks = sum(
+        1 for outcome in outcomes
+        if outcome["chunk_ids"] != [res["chunk_id"] for res in outcome["record"].get("local_results", [])]
+    )
+    changed_answers = sum(
+        1 for outcome in outcomes
+        if outcome["record"].get("llm_response")
+        and outcome["result"].get("answer") != outcome["record"]["llm_response"].get("answer")
+    )
+
+    print(f"Replayed {len(outcomes)} requests in {wall_time:.2f}s")
+    print(f"End-to-end latency: p50={percentile(latencies, 50):.4f}s p95={percentile(latencies, 95):.4f}s "
+          f"p99={percentile(latencies, 99):.4f}s")
+    print(f"Local search: p50={percentile(local_search, 50):.4f}s p95={percentile(local_search, 95):.4f}s "
+          f"(recorded p50={percentile(recorded_local, 50):.4f}s p95={percentile(recorded_local, 95):.4f}s)")
+    print(f"Requests with different retrieved chunk ids: {changed_chunks}")
+    print(f"Requests with different answers: {changed_answers}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured /ask traffic for profiling.")
+    parser.add_argument("captures", nargs="+", help="Capture files (.jsonl.gz)")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Replay rate relative to the original (2 = twice as fast, 0 = all at once)")
+    parser.add_argument("--limit", type=int, default=0, help="Replay at most this many requests")
+    parser.add_argument("--simulate-latency", action="store_true",
+                        help="Sleep for the recorded web search and LLM durations")
+    parser.add_argument("--option-aware", action="store_true",
+                        help="Use option-aware multi-query retrieval for every request")
+    parser.add_argument("--cprofile", metavar="OUTPUT", help="Write cProfile stats to this file")
+    parser.add_argument("--wait-for-profiler", type=float, default=0.0, metavar="SECONDS",
+                        help="Print the PID and wait before replaying so py-spy can attach")
+    args = parser.parse_args()
+
+    # Các file từ nhiều worker/PID được đọc theo thứ tự glob, nên sắp xếp lại theo thời điểm đến
+    records = sorted(load_capture(args.captures), key=lambda record: record.get("timestamp", 0.0))
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print("No records found in capture files.")
+        sys.exit(1)
+    print(f"Loaded {len(records)} captured requests")
+
+    pipeline = build_pipeline(records, args.simulate_latency)
+
+    if args.wait_for_profiler:
+        print(f"PID {os.getpid()}: attach with `py-spy record -p {os.getpid()}`, "
+              f"starting in {args.wait_for_profiler:.0f}s")
+        time.sleep(args.wait_for_profiler)
+
+    profiler = cProfile.Profile() if args.cprofile else None
+    if profiler:
+        profiler.enable()
+    start_time = time.perf_counter()
+    outcomes = asyncio.run(replay(pipeline, records, args.speed, args.option_aware))
+    wall_time = time.perf_counter() - start_time
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.cprofile)
+        print(f"cProfile stats written to {args.cprofile}")
+
+    report(outcomes, wall_time)
+
+
+if __name__ == "__main__":
+    main()
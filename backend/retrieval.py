@@ -1,13 +1,56 @@
-from typing import List, Dict, Any
+import re
+import time
+from typing import List, Dict, Any, Optional, Tuple
 from vector_db import VectorDB
 from web_search import WebSearcher
 
+# Nhãn đáp án dạng "A. ...", "B) ...", "(C) ...", "D: ..." ở đầu dòng
+LINE_OPTION_PATTERN = re.compile(r'^[ \t]*\(?([A-H])[\.\):][ \t]*(?=\S)', re.MULTILINE)
+# Nhãn đáp án nằm cùng dòng, ví dụ "Q? A. x B. y C. z D. w"
+INLINE_OPTION_PATTERN = re.compile(r'(?:^|(?<=\s))\(?([A-H])[\.\):]\s+(?=\S)')
+
+def _ordered_option_markers(matches) -> List[re.Match]:
+    """Keep only the markers that continue the sequence A, B, C, ... in order."""
+    markers = []
+    expected = "A"
+    for match in matches:
+        if match.group(1) == expected:
+            markers.append(match)
+            expected = chr(ord(expected) + 1)
+    return markers
+
+def parse_mcq(question: str) -> Tuple[str, Dict[str, str]]:
+    """
+    Split a multiple-choice question into its stem and labelled options.
+    
+    Options are accepted only when their labels appear in order (A, B, C, ...),
+    either one per line or inline. Lines after an option label without a label
+    of their own are continuations of that option.
+    
+    Returns:
+        Tuple of (stem, {label: option_text}); options is empty if none were found
+    """
+    for pattern in (LINE_OPTION_PATTERN, INLINE_OPTION_PATTERN):
+        markers = _ordered_option_markers(pattern.finditer(question))
+        if len(markers) < 2:
+            continue
+        
+        stem = " ".join(question[:markers[0].start()].split())
+        options = {}
+        for i, marker in enumerate(markers):
+            end = markers[i + 1].start() if i + 1 < len(markers) else len(question)
+            options[marker.group(1)] = " ".join(question[marker.end():end].split())
+        return stem, options
+    
+    return " ".join(question.split()), {}
+
 class Retriever:
     def __init__(self, vector_db: VectorDB):
         self.vector_db = vector_db
         self.web_searcher = WebSearcher()
     
-    async def retrieve(self, query: str, top_k: int = 3, use_web_search: bool = True) -> Dict[str, Any]:
+    async def retrieve(self, query: str, top_k: int = 3, use_web_search: bool = True,
+                       option_aware: bool = False, evidence_budget: Optional[int] = None) -> Dict[str, Any]:
         """
         Retrieve the most relevant document chunks for a given query.
         Optionally also retrieve information from the web.
@@ -16,19 +59,36 @@ class Retriever:
             query: The query string to search for
             top_k: Number of relevant chunks to retrieve from vector DB
             use_web_search: Whether to include web search results
+            option_aware: Search with one stem+option sub-query per MCQ option
+            evidence_budget: Total local chunks shared by all options in option-aware mode
+                (defaults to max(top_k, number of options), one chunk per option)
             
         Returns:
-            Dictionary with local and web search results
+            Dictionary with local and web search results, plus per-stage timings in seconds.
+            In option-aware mode also contains option_evidence, mapping each option label
+            to the chunk ids supporting it.
         """
         try:
             # Search results container
             all_results = {
                 "local_results": [],
-                "web_results": []
+                "web_results": [],
+                "timings": {}
             }
             
             # 1. Retrieve from local vector DB
-            local_results = self.vector_db.search(query, top_k=top_k)
+            start_time = time.perf_counter()
+            stem, options = parse_mcq(query) if option_aware else ("", {})
+            if option_aware and not (stem and options):
+                print(f"Option-aware retrieval: could not parse stem and options, using single query: {query}")
+            if stem and options:
+                local_results, option_evidence = await self._retrieve_per_option(
+                    stem, options, top_k=top_k, evidence_budget=evidence_budget
+                )
+                all_results["option_evidence"] = option_evidence
+            else:
+                local_results = await self.vector_db.search_async(query, top_k=top_k)
+            all_results["timings"]["local_search"] = time.perf_counter() - start_time
             
             # Log the results
             if local_results:
@@ -42,7 +102,9 @@ class Retriever:
             
             # 2. Optional web search for additional context
             if use_web_search:
+                start_time = time.perf_counter()
                 web_results = await self.web_searcher.search(query)
+                all_results["timings"]["web_search"] = time.perf_counter() - start_time
                 all_results["web_results"] = web_results
                 print(f"Found {len(web_results)} web search results for query: {query}")
                 
@@ -52,6 +114,69 @@ class Retriever:
             print(f"Error during retrieval: {str(e)}")
             raise
     
+    async def _retrieve_per_option(self, stem: str, options: Dict[str, str], top_k: int,
+                                   evidence_budget: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Dict[str, List[int]]]:
+        """
+        Search the stem and every stem+option sub-query in one batched encode and
+        FAISS search, then fuse the hits under a shared chunk budget: every option
+        first gets its best chunk, the rest of the budget goes to the closest hits
+        of any sub-query.
+        
+        Returns:
+            Tuple of (deduplicated local results, {label: supporting chunk ids})
+        """
+        labels = ["stem"] + list(options)
+        sub_queries = [stem] + [f"{stem} {text}" for text in options.values()]
+        per_query_results = await self.vector_db.search_batch_async(sub_queries, top_k=top_k)
+        
+        # Mặc định đủ để mỗi đáp án có ít nhất một chunk, và không ít hơn truy vấn đơn
+        budget = evidence_budget or max(top_k, len(options))
+        
+        selected = {}
+        
+        def select(result: Dict[str, Any]) -> None:
+            chunk_id = result["chunk_id"]
+            if chunk_id not in selected:
+                selected[chunk_id] = dict(result)
+            else:
+                selected[chunk_id]["distance"] = min(selected[chunk_id]["distance"], result["distance"])
+        
+        # 1. Mỗi đáp án một chunk trước, đáp án có hit gần nhất được chọn trước nếu budget không đủ
+        option_results = [results for label, results in zip(labels, per_query_results) if label != "stem"]
+        for results in sorted((r for r in option_results if r), key=lambda r: r[0]["distance"]):
+            if any(res["chunk_id"] in selected for res in results):
+                # Đáp án đã có bằng chứng từ chunk mà đáp án khác cũng tìm thấy
+                continue
+            if len(selected) >= budget:
+                break
+            select(results[0])
+        
+        # 2. Phần budget còn lại dành cho các hit gần nhất của mọi sub-query (kể cả stem)
+        all_hits = sorted(
+            (res for results in per_query_results for res in results),
+            key=lambda res: res["distance"]
+        )
+        for result in all_hits:
+            if result["chunk_id"] in selected or len(selected) < budget:
+                select(result)
+        
+        # Gán chunk đã chọn cho các đáp án có chunk đó trong kết quả của mình
+        option_evidence = {}
+        for label, results in zip(labels, per_query_results):
+            if label == "stem":
+                continue
+            option_evidence[label] = list(dict.fromkeys(res["chunk_id"] for res in results if res["chunk_id"] in selected))
+        
+        missing = [label for label, ids in option_evidence.items() if not ids]
+        if missing:
+            print(f"Option-aware retrieval: no evidence within budget {budget} for options {', '.join(missing)}")
+        
+        local_results = sorted(selected.values(), key=lambda res: res["distance"])
+        for result in local_results:
+            result["options"] = [label for label, ids in option_evidence.items() if result["chunk_id"] in ids]
+        
+        return local_results, option_evidence
+    
     def get_context_from_results(self, results: Dict[str, Any], max_local_results: int = 3, max_web_results: int = 3) -> str:
         """
         Combine both local and web results into a single context string.
@@ -68,10 +193,17 @@ class Retriever:
         
         # 1. Add local document chunks if available
         local_results = results.get("local_results", [])
+        if "option_evidence" in results:
+            # Option-aware retrieval already limited the chunks to its shared budget
+            max_local_results = max(max_local_results, len(local_results))
         if local_results:
             context_parts.append("LOCAL KNOWLEDGE BASE:")
             for i, result in enumerate(local_results[:max_local_results]):
-                context_parts.append(f"DOCUMENT {i+1}:\n{result['text']}\n")
+                if result.get("options"):
+                    label = ", ".join(result["options"])
+                    context_parts.append(f"DOCUMENT {i+1} (relevant to options {label}):\n{result['text']}\n")
+                else:
+                    context_parts.append(f"DOCUMENT {i+1}:\n{result['text']}\n")
             context_parts.append("\n")
             
         # 2. Add web search results if available
@@ -0,0 +1,200 @@
+import os
+import glob
+import gzip
+import json
+import time
+import queue
+import random
+import threading
+import itertools
+from typing import Dict, Any, List, Optional, Iterator
+
+# Bật ghi lại traffic /ask (mặc định tắt)
+CAPTURE_ENABLED = os.getenv("CAPTURE_ENABLED", "false").lower() in ("1", "true", "yes")
+# Tỉ lệ request được ghi lại (0.0 - 1.0)
+CAPTURE_SAMPLE_RATE = float(os.getenv("CAPTURE_SAMPLE_RATE", "0.1"))
+# Thư mục chứa các file capture
+CAPTURE_DIR = os.getenv("CAPTURE_DIR", "../captures")
+# Kích thước tối đa (byte, chưa nén) của một file trước khi xoay vòng
+CAPTURE_MAX_BYTES = int(os.getenv("CAPTURE_MAX_BYTES", str(50 * 1024 * 1024)))
+# Số file capture mỗi process giữ lại, các file cũ hơn của process đó sẽ bị xóa
+CAPTURE_MAX_FILES = int(os.getenv("CAPTURE_MAX_FILES", "10"))
+# Khoảng thời gian (giây) giữa các lần flush file gzip
+CAPTURE_FLUSH_INTERVAL = float(os.getenv("CAPTURE_FLUSH_INTERVAL", "5"))
+# Số bản ghi tối đa chờ ghi; vượt quá thì bỏ bản ghi thay vì làm chậm request
+CAPTURE_QUEUE_SIZE = int(os.getenv("CAPTURE_QUEUE_SIZE", "1000"))
+
+# Mẫu tên file capture của một process
+CAPTURE_FILE_PATTERN = "capture-*-{pid}-*.jsonl.gz"
+# Đánh dấu dừng thread ghi
+_STOP = object()
+
+
+class TrafficRecorder:
+    """
+    Ghi lại mẫu các request /ask vào file JSONL nén gzip, có xoay vòng theo kích thước.
+
+    Mỗi dòng chứa câu hỏi, các cờ, chunk id và distance được truy xuất, kết quả web,
+    câu trả lời của LLM và thời gian của từng bước, đủ để replay.py chạy lại offline.
+    """
+
+    def __init__(self, capture_dir: str = CAPTURE_DIR, sample_rate: float = CAPTURE_SAMPLE_RATE,
+                 max_bytes: int = CAPTURE_MAX_BYTES, max_files: int = CAPTURE_MAX_FILES,
+                 enabled: bool = CAPTURE_ENABLED, flush_interval: float = CAPTURE_FLUSH_INTERVAL):
+        self.capture_dir = capture_dir
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.max_files = max(1, max_files)
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_sequence = itertools.count()
+        self._bytes_written = 0
+        self._records_written = 0
+        self._records_dropped = 0
+        # Một thread ghi riêng để request không phải chờ I/O của capture
+        self._queue = queue.Queue(maxsize=CAPTURE_QUEUE_SIZE)
+        self._writer = None
+
+    def should_sample(self) -> bool:
+        """Decide whether the current request should be captured."""
+        return self.enabled and random.random() < self.sample_rate
+
+    def submit(self, record: Dict[str, Any]) -> None:
+        """Queue a record for the writer thread without blocking; drops it if the queue is full."""
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._writer_loop, name="capture-writer", daemon=True)
+                self._writer.start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self._records_dropped += 1
+
+    def _writer_loop(self) -> None:
+        last_flush = time.monotonic()
+        while True:
+            try:
+                record = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                record = None
+            if record is _STOP:
+                break
+            if record is not None:
+                try:
+                    self.write(record)
+                except Exception as e:
+                    print(f"Error writing capture record: {str(e)}")
+            # Flush theo chu kỳ thay vì mỗi bản ghi để không làm hỏng tỉ lệ nén gzip
+            if time.monotonic() - last_flush >= self.flush_interval:
+                with self._lock:
+                    if self._file is not None:
+                        self._file.flush()
+                last_flush = time.monotonic()
+
+    def _open_new_file(self) -> None:
+        os.makedirs(self.capture_dir, exist_ok=True)
+        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        # Số thứ tự giúp tên file không trùng khi xoay vòng nhiều lần trong cùng một giây
+        sequence = next(self._file_sequence)
+        path = os.path.join(self.capture_dir, f"capture-{timestamp}-{os.getpid()}-{sequence:04d}.jsonl.gz")
+        self._file = gzip.open(path, "at", encoding="utf-8")
+        self._bytes_written = 0
+        print(f"Capturing traffic to {path}")
+
+        # Xóa các file cũ vượt quá số lượng cho phép; chỉ xét file của process này
+        # để không xóa file mà worker khác vẫn đang ghi
+        own_pattern = CAPTURE_FILE_PATTERN.format(pid=os.getpid())
+        files = sorted(glob.glob(os.path.join(self.capture_dir, own_pattern)), key=os.path.getmtime)
+        for old_file in files[:-self.max_files]:
+            os.remove(old_file)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        """Append a record to the current capture file, rotating it when full. Blocking."""
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is None or self._bytes_written >= self.max_bytes:
+                self.close_file()
+                self._open_new_file()
+            self._file.write(line)
+            self._bytes_written += len(line.encode("utf-8"))
+            self._records_written += 1
+
+    def close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self) -> None:
+        """Write out queued records, stop the writer thread and close the current file."""
+        if self._writer is not None:
+            self._queue.put(_STOP)
+            self._writer.join()
+            self._writer = None
+        with self._lock:
+            self.close_file()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return capture settings and written / queued / dropped record counts."""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "sample_rate": self.sample_rate,
+                "records_written": self._records_written,
+                "records_queued": self._queue.qsize(),
+                "records_dropped": self._records_dropped,
+            }
+
+
+def build_capture_record(request_id: str, arrival_time: float, question: str, flags: Dict[str, Any],
+                         retrieved_results: Dict[str, Any], llm_response: Optional[Dict[str, Any]],
+                         timings: Dict[str, float]) -> Dict[str, Any]:
+    """
+    Build the JSON-serialisable record for one /ask request. `timestamp` is the
+    arrival time (before admission), which replay uses to reproduce the arrival
+    pattern. `flags` holds the answer_question arguments (top_k, use_web_search,
+    option_aware, evidence_budget).
+    """
+    return {
+        "request_id": request_id,
+        "timestamp": arrival_time,
+        "question": question,
+        **flags,
+        "local_results": [
+            {"chunk_id": res["chunk_id"], "distance": res["distance"]}
+            for res in retrieved_results.get("local_results", [])
+        ],
+        "option_evidence": retrieved_results.get("option_evidence"),
+        "web_results": retrieved_results.get("web_results", []),
+        "llm_response": llm_response,
+        "timings": {name: round(value, 6) for name, value in timings.items()},
+    }
+
+
+def load_capture(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Read capture records from one or more .jsonl.gz files, in file order.
+
+    A file that is still being written (or whose server was killed) has no gzip
+    end marker; the records flushed so far are kept and the truncation is logged.
+    """
+    for path in paths:
+        count = 0
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Dòng cuối có thể bị cắt giữa chừng nếu file chưa được đóng
+                        print(f"Skipping incomplete record in {path}")
+                        continue
+                    count += 1
+                    yield record
+            except EOFError:
+                print(f"Capture file {path} is truncated (not closed cleanly); read {count} records")
@@ -4,6 +4,8 @@ import faiss
 from sentence_transformers import SentenceTransformer
 from typing import List, Dict, Tuple
 import pickle
+import threading
+from executors import encode_executor, search_executor
 
 class VectorDB:
     def __init__(self, model_name: str = "all-MiniLM-L6-v2", index_path: str = "../models/faiss_index"):
@@ -11,6 +13,10 @@ class VectorDB:
         self.index_path = index_path
         self.embedding_dim = 384  # all-MiniLM-L6-v2 has 384 dimensions
         self.model = SentenceTransformer(model_name)
+        # Tokenizer của SentenceTransformer không thread-safe nên mỗi thread encode giữ model riêng
+        self._local = threading.local()
+        self._model_lock = threading.Lock()
+        self._model_claimed = False
         self.index = None
         self.chunks = []
         self.chunk_size = 800  # target tokens per chunk
@@ -105,28 +111,87 @@ class VectorDB:
         
         print(f"Loaded index with {self.index.ntotal} vectors and {len(self.chunks)} chunks")
     
+    def _get_model(self) -> SentenceTransformer:
+        """
+        Return the model owned by the current encode thread. The first thread
+        reuses self.model (only used directly at startup); others load a copy.
+        """
+        model = getattr(self._local, "model", None)
+        if model is None:
+            with self._model_lock:
+                if not self._model_claimed:
+                    self._model_claimed = True
+                    model = self.model
+                else:
+                    model = SentenceTransformer(self.model_name)
+            self._local.model = model
+        return model
+    
+    def _encode_query(self, query: str) -> np.ndarray:
+        """Encode a query into a float32 row vector for FAISS."""
+        return self._get_model().encode([query])[0].reshape(1, -1).astype(np.float32)
+    
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Encode several queries in a single batched call."""
+        return np.asarray(self._get_model().encode(queries), dtype=np.float32)
+    
+    def _search_embeddings_batch(self, query_embeddings: np.ndarray, top_k: int) -> List[List[Dict[str, any]]]:
+        """Search the index with a batch of pre-computed query embeddings, one result list per row."""
+        # Search the index
+        distances, indices = self.index.search(query_embeddings, top_k)
+        
+        # Prepare results
+        all_results = []
+        for row in range(len(indices)):
+            results = []
+            for i, idx in enumerate(indices[row]):
+                if idx != -1:  # FAISS returns -1 for not enough results
+                    results.append({
+                        "chunk_id": int(idx),
+                        "distance": float(distances[row][i]),
+                        "text": self.chunks[idx]
+                    })
+            all_results.append(results)
+        
+        return all_results
+    
+    def _search_embeddings(self, query_embedding: np.ndarray, top_k: int) -> List[Dict[str, any]]:
+        """Search the index with a pre-computed query embedding."""
+        return self._search_embeddings_batch(query_embedding, top_k)[0]
+    
     def search(self, query: str, top_k: int = 3) -> List[Dict[str, any]]:
         """Search the index for chunks most similar to the query."""
         if self.index is None:
             raise ValueError("No index loaded. Call load_index first.")
         
         # Encode the query
-        query_embedding = self.model.encode([query])[0].reshape(1, -1).astype(np.float32)
+        query_embedding = self._encode_query(query)
         
-        # Search the index
-        distances, indices = self.index.search(query_embedding, top_k)
+        return self._search_embeddings(query_embedding, top_k)
+    
+    async def search_async(self, query: str, top_k: int = 3) -> List[Dict[str, any]]:
+        """
+        Same as search, but runs encoding and the FAISS search on their own
+        executors so neither blocks the event loop.
+        """
+        if self.index is None:
+            raise ValueError("No index loaded. Call load_index first.")
         
-        # Prepare results
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx != -1:  # FAISS returns -1 for not enough results
-                results.append({
-                    "chunk_id": int(idx),
-                    "distance": float(distances[0][i]),
-                    "text": self.chunks[idx]
-                })
-        
-        return results
+        query_embedding = await encode_executor.run(self._encode_query, query)
+        return await search_executor.run(self._search_embeddings, query_embedding, top_k)
+    
+    async def search_batch_async(self, queries: List[str], top_k: int = 3) -> List[List[Dict[str, any]]]:
+        """
+        Search for several queries with one batched encode and one FAISS search.
+        Returns one result list per query, in the same order.
+        """
+        if self.index is None:
+            raise ValueError("No index loaded. Call load_index first.")
+        if not queries:
+            return []
+        
+        query_embeddings = await encode_executor.run(self._encode_queries, queries)
+        return await search_executor.run(self._search_embeddings_batch, query_embeddings, top_k)
 
 # Helper function to initialize and prepare vector database
 def initialize_vector_db(document_path: str) -> VectorDB:
@@ -1,10 +1,11 @@
 import aiohttp
-import asyncio
 from typing import List, Dict, Any
 from duckduckgo_search import DDGS
 import re
 import os
+import threading
 from dotenv import load_dotenv
+from executors import io_executor
 
 # Số lượng kết quả tìm kiếm tối đa
 MAX_SEARCH_RESULTS = 5
@@ -15,7 +16,19 @@ class WebSearcher:
     """Lớp xử lý tìm kiếm thông tin từ internet."""
     
     def __init__(self):
-        self.ddgs = DDGS()
+        # DDGS không thread-safe nên mỗi thread I/O giữ một instance riêng
+        self._local = threading.local()
+    
+    def _get_ddgs(self) -> DDGS:
+        """Return the DDGS client owned by the current thread."""
+        ddgs = getattr(self._local, "ddgs", None)
+        if ddgs is None:
+            ddgs = DDGS()
+            self._local.ddgs = ddgs
+        return ddgs
+    
+    def _search_sync(self, search_query: str, max_results: int) -> List[Dict[str, Any]]:
+        return list(self._get_ddgs().text(search_query, max_results=max_results))
     
     async def search(self, query: str, max_results: int = MAX_SEARCH_RESULTS) -> List[Dict[str, Any]]:
         """
@@ -36,11 +49,8 @@ class WebSearcher:
             # Sử dụng DuckDuckGo Search API
             results = []
             try:
-                # Sử dụng DuckDuckGo Search trong thread pool để không block event loop
-                loop = asyncio.get_event_loop()
-                raw_results = await loop.run_in_executor(
-                    None, lambda: list(self.ddgs.text(search_query, max_results=max_results))
-                )
+                # Sử dụng DuckDuckGo Search trong executor I/O riêng để không block event loop
+                raw_results = await io_executor.run(self._search_sync, search_query, max_results)
                 
                 # Xử lý kết quả thô thành định dạng chuẩn
                 for result in raw_results: